@@ -5,14 +5,20 @@ Checks for changes in form submission options and sends SMS notifications
 """
 
 import os
+import gzip
 import hashlib
+import importlib.util
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+import soupsieve
 import json
 from datetime import datetime
 import smtplib
+import atexit
 from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 # Twilio imports (comment out if using Gmail SMS)
 try:
@@ -21,125 +27,260 @@ try:
 except ImportError:
     TWILIO_AVAILABLE = False
 
+# Gmail SMTP connection shared by all notifications in this run
+_SMTP = None
+
+# Returned by fetch_page_content when the server answers 304 Not Modified
+NOT_MODIFIED = object()
+
+# Prefer the C-backed lxml parser, fall back to the stdlib parser if missing
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# orjson is a much faster JSON serializer, fall back to stdlib json if missing
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Only advertise brotli when we can decode it
+ACCEPT_ENCODING = 'gzip, deflate, br' if importlib.util.find_spec('brotli') else 'gzip, deflate'
+
+# Common selectors for activities and registration elements, compiled once and
+# merged so the page tree is walked once
+ACTIVITY_SELECTORS = [
+    '.activity', '.event', '.program', '.tour',
+    '[class*="activity"]', '[class*="event"]', '[class*="registration"]',
+    'button[class*="register"]', 'a[class*="register"]',
+    '.btn', 'button', 'a[href*="register"]'
+]
+ACTIVITY_SELECTOR = soupsieve.compile(', '.join(ACTIVITY_SELECTORS))
+
+# Text indicating availability, sold out, registration status
+STATUS_RE = re.compile(r'available|sold out|full|register|book now|reserve|waitlist', re.IGNORECASE)
+
+# Snapshot sections and the keys their precomputed hashes are stored under
+SECTION_HASHES = {
+    'forms': 'form_hash',
+    'activities': 'activities_hash',
+    'status_elements': 'status_hash'
+}
+
+# Shared session so repeated fetches reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Encoding': ACCEPT_ENCODING
+})
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20,
+                       max_retries=Retry(total=3, backoff_factor=0.3))
+SESSION.mount('http://', _adapter)
+SESSION.mount('https://', _adapter)
+
 TARGET_URL = os.getenv("TARGET_URL", "https://apply.northeastern.edu/register/?id=a02017b1-9598-4898-b883-e11e8b7caca3")
 SNAPSHOT_FILE = "page_snapshot.json"
-CONTENT_FILE = "page_content.html"
+CONTENT_FILE = "page_content.html.gz"
+HASH_FILE = "page_hash.txt"
 
-def fetch_page_content():
-    """Fetch and parse the Northeastern visit page"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+def fetch_page_content(etag=None, last_modified=None):
+    """Fetch the raw bytes and cache validators of the Northeastern visit page"""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     
     try:
-        response = requests.get(TARGET_URL, headers=headers, timeout=30)
+        response = SESSION.get(TARGET_URL, headers=headers, timeout=30)
+        if response.status_code == 304:
+            return NOT_MODIFIED
         response.raise_for_status()
-        return response.text
+        return response.content, response.headers.get('ETag'), response.headers.get('Last-Modified')
     except requests.RequestException as e:
         print(f"Error fetching page: {e}")
         return None
 
 def extract_form_data(html_content):
     """Extract relevant form data and activities from the page"""
-    soup = BeautifulSoup(html_content, 'html.parser')
+    soup = BeautifulSoup(html_content, HTML_PARSER)
     
     # Look for form elements, activity listings, and registration options
     form_data = {}
     
-    # Find forms
+    # Find forms and extract their inputs
     forms = soup.find_all('form')
     for i, form in enumerate(forms):
         form_data[f'form_{i}'] = {
             'action': form.get('action', ''),
             'method': form.get('method', ''),
-            'inputs': []
+            'inputs': [
+                {
+                    'type': inp.get('type', inp.name or 'unknown'),
+                    'name': inp.get('name', ''),
+                    'value': inp.get('value', ''),
+                    'text': inp.get_text(strip=True)
+                }
+                for inp in form.find_all(['input', 'select', 'textarea', 'button'])
+            ]
         }
-        
-        # Extract form inputs
-        inputs = form.find_all(['input', 'select', 'textarea', 'button'])
-        for inp in inputs:
-            input_data = {
-                'type': inp.get('type', inp.name if inp.name else 'unknown'),
-                'name': inp.get('name', ''),
-                'value': inp.get('value', ''),
-                'text': inp.get_text(strip=True) if inp.get_text(strip=True) else ''
-            }
-            form_data[f'form_{i}']['inputs'].append(input_data)
     
     # Look for activity listings, registration buttons, availability status
     activities = []
     
-    # Common selectors for activities and registration elements
-    activity_selectors = [
-        '.activity', '.event', '.program', '.tour',
-        '[class*="activity"]', '[class*="event"]', '[class*="registration"]',
-        'button[class*="register"]', 'a[class*="register"]',
-        '.btn', 'button', 'a[href*="register"]'
-    ]
-    
-    for selector in activity_selectors:
-        elements = soup.select(selector)
-        for elem in elements:
-            text = elem.get_text(strip=True)
-            if text and len(text) > 5:  # Filter out empty or very short text
-                activities.append({
-                    'selector': selector,
-                    'text': text,
-                    'href': elem.get('href', ''),
-                    'class': elem.get('class', [])
-                })
+    # Single pass over the tree; each element is reported once
+    for elem in ACTIVITY_SELECTOR.select(soup):
+        text = elem.get_text(strip=True)
+        if text and len(text) > 5:  # Filter out empty or very short text
+            activities.append({
+                'text': text,
+                'href': elem.get('href', ''),
+                'class': ' '.join(elem.get('class', []))
+            })
     
     # Look for any text indicating availability, sold out, registration status
-    status_keywords = ['available', 'sold out', 'full', 'register', 'book now', 'reserve', 'waitlist']
     status_elements = []
     
-    for keyword in status_keywords:
-        elements = soup.find_all(string=lambda x: x and keyword.lower() in x.lower())
-        for elem in elements:
-            if elem.parent:
-                status_elements.append({
-                    'keyword': keyword,
-                    'text': elem.strip(),
-                    'parent_tag': elem.parent.name,
-                    'parent_class': elem.parent.get('class', [])
-                })
-    
-    return {
+    for elem in soup.find_all(string=STATUS_RE):
+        parent = elem.parent
+        if parent:
+            status_elements.append({
+                'keyword': STATUS_RE.search(elem).group(0).lower(),
+                'text': elem.strip(),
+                'parent_tag': parent.name,
+                'parent_class': parent.get('class', [])
+            })
+    
+    data = {
         'forms': form_data,
         'activities': activities,
         'status_elements': status_elements,
         'page_title': soup.title.string if soup.title else '',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'activity_fps': [calculate_fingerprint(act['text']) for act in activities]
     }
+    for section, hash_key in SECTION_HASHES.items():
+        data[hash_key] = calculate_section_hash(data[section])
+    return data
+
+def dump_json(data, sort_keys=False, indent=False):
+    """Serialize data to JSON bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        option = 0
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, sort_keys=sort_keys, indent=2 if indent else None).encode('utf-8')
+
+def load_json(raw):
+    """Deserialize JSON bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 def load_previous_snapshot():
     """Load the previous page snapshot"""
     if os.path.exists(SNAPSHOT_FILE):
         try:
-            with open(SNAPSHOT_FILE, 'r') as f:
-                return json.load(f)
+            with open(SNAPSHOT_FILE, 'rb') as f:
+                return load_json(f.read())
         except (json.JSONDecodeError, IOError):
             return None
     return None
 
 def save_snapshot(data):
     """Save current snapshot to file"""
-    with open(SNAPSHOT_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    # Write to a temp file and swap it in so an interrupted run never leaves a partial snapshot
+    tmp_file = SNAPSHOT_FILE + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(dump_json(data, indent=True))
+    os.replace(tmp_file, SNAPSHOT_FILE)
 
 def save_content(html_content):
     """Save raw HTML content for debugging"""
-    with open(CONTENT_FILE, 'w', encoding='utf-8') as f:
+    with gzip.open(CONTENT_FILE, 'wb', compresslevel=1) as f:
         f.write(html_content)
 
+def load_hash():
+    """Load the previous raw HTML hash, ETag and Last-Modified"""
+    if os.path.exists(HASH_FILE):
+        try:
+            with open(HASH_FILE, 'r') as f:
+                lines = f.read().splitlines()
+            lines += [''] * (3 - len(lines))
+            return tuple(line or None for line in lines[:3])
+        except IOError:
+            pass
+    return None, None, None
+
+def save_hash(raw_hash, etag=None, last_modified=None):
+    """Save the current raw HTML hash, ETag and Last-Modified"""
+    with open(HASH_FILE, 'w') as f:
+        f.write(f"{raw_hash}\n{etag or ''}\n{last_modified or ''}\n")
+
 def calculate_content_hash(data):
     """Calculate hash of relevant content for comparison"""
-    # Remove timestamp for comparison
+    # Remove timestamp and derived activity fingerprints for comparison
     comparison_data = data.copy()
     comparison_data.pop('timestamp', None)
+    comparison_data.pop('activity_fps', None)
+    
+    # Sections with a precomputed hash are represented by that hash alone
+    for section, hash_key in SECTION_HASHES.items():
+        if hash_key in comparison_data:
+            comparison_data.pop(section, None)
     
-    content_str = json.dumps(comparison_data, sort_keys=True)
-    return hashlib.md5(content_str.encode()).hexdigest()
+    return hashlib.blake2b(dump_json(comparison_data, sort_keys=True), digest_size=16).hexdigest()
+
+def calculate_section_hash(section):
+    """Calculate hash of a single snapshot section"""
+    return hashlib.blake2b(dump_json(section, sort_keys=True), digest_size=16).hexdigest()
+
+def calculate_fingerprint(text):
+    """Calculate a 64-bit integer fingerprint of a piece of text"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def get_activity_fingerprints(data):
+    """Get activity fingerprints, computing them for older snapshots"""
+    if 'activity_fps' in data:
+        return data['activity_fps']
+    return [calculate_fingerprint(act['text']) for act in data.get('activities', [])]
+
+def calculate_raw_hash(html_content):
+    """Calculate hash of the raw page HTML for the quick no-change check"""
+    return hashlib.blake2b(html_content, digest_size=16).hexdigest()
+
+def _get_smtp(gmail_user, gmail_password):
+    """Get the cached Gmail SMTP connection, logging in on first use"""
+    global _SMTP
+    if _SMTP is None:
+        server = smtplib.SMTP('smtp.gmail.com', 587)
+        server.starttls()
+        server.login(gmail_user, gmail_password)
+        _SMTP = server
+    return _SMTP
+
+def _close_smtp():
+    """Close the cached SMTP connection at process exit"""
+    global _SMTP
+    if _SMTP is not None:
+        try:
+            _SMTP.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        _SMTP = None
+
+atexit.register(_close_smtp)
+
+def send_smtp_message(msg, gmail_user, gmail_password):
+    """Send a message over the cached SMTP connection, reconnecting once if it dropped"""
+    global _SMTP
+    try:
+        _get_smtp(gmail_user, gmail_password).send_message(msg)
+    except smtplib.SMTPServerDisconnected:
+        _SMTP = None
+        _get_smtp(gmail_user, gmail_password).send_message(msg)
 
 def send_sms_twilio(message):
     """Send SMS using Twilio"""
@@ -185,11 +326,7 @@ def send_sms_gmail(message):
         msg['From'] = gmail_user
         msg['To'] = sms_email
         
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        server.send_message(msg)
-        server.quit()
+        send_smtp_message(msg, gmail_user, gmail_password)
         
         print("SMS sent successfully via Gmail")
         return True
@@ -221,11 +358,7 @@ def send_email_notification(subject, body):
         msg['From'] = gmail_user
         msg['To'] = email_recipient
 
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        server.send_message(msg)
-        server.quit()
+        send_smtp_message(msg, gmail_user, gmail_password)
 
         print("Email notification sent successfully")
         return True
@@ -263,16 +396,18 @@ def compare_snapshots(old_data, new_data):
     if len(old_forms) != len(new_forms):
         changes.append(f"Number of forms changed: {len(old_forms)} -> {len(new_forms)}")
     
-    # Compare activities
-    old_activities = set(act['text'] for act in old_data.get('activities', []))
-    new_activities = set(act['text'] for act in new_data.get('activities', []))
+    # Compare activities by fingerprint, only looking up text for the differences
+    old_fps = get_activity_fingerprints(old_data)
+    new_fps = get_activity_fingerprints(new_data)
     
-    added_activities = new_activities - old_activities
-    removed_activities = old_activities - new_activities
+    added_fps = set(new_fps).difference(old_fps)
+    removed_fps = set(old_fps).difference(new_fps)
     
-    if added_activities:
+    if added_fps:
+        added_activities = dict.fromkeys(act['text'] for fp, act in zip(new_fps, new_data.get('activities', [])) if fp in added_fps)
         changes.append(f"New activities: {', '.join(list(added_activities)[:3])}")
-    if removed_activities:
+    if removed_fps:
+        removed_activities = dict.fromkeys(act['text'] for fp, act in zip(old_fps, old_data.get('activities', [])) if fp in removed_fps)
         changes.append(f"Removed activities: {', '.join(list(removed_activities)[:3])}")
     
     # Compare status elements
@@ -288,14 +423,32 @@ def compare_snapshots(old_data, new_data):
 def main():
     print(f"Monitoring {TARGET_URL} at {datetime.now()}")
     
+    # Only make the request conditional when there is a baseline to fall back on
+    previous_hash, etag, last_modified = load_hash()
+    if not os.path.exists(SNAPSHOT_FILE):
+        previous_hash, etag, last_modified = None, None, None
+    
     # Fetch current page
-    html_content = fetch_page_content()
-    if not html_content:
+    result = fetch_page_content(etag, last_modified)
+    if result is NOT_MODIFIED:
+        print("No changes detected (page not modified)")
+        return
+    if not result or not result[0]:
         print("Failed to fetch page content")
         return
+    html_content, new_etag, new_last_modified = result
     
     # Save raw content for debugging
-    save_content(html_content)
+    if os.getenv('DEBUG_SAVE_HTML'):
+        save_content(html_content)
+    
+    # Skip parsing and the snapshot load entirely when the raw HTML is unchanged
+    raw_hash = calculate_raw_hash(html_content)
+    if previous_hash == raw_hash:
+        if (new_etag, new_last_modified) != (etag, last_modified):
+            save_hash(raw_hash, new_etag, new_last_modified)
+        print("No changes detected (page HTML unchanged)")
+        return
     
     # Extract structured data
     current_data = extract_form_data(html_content)
@@ -326,6 +479,7 @@ def main():
     
     # Save current snapshot
     save_snapshot(current_data)
+    save_hash(raw_hash, new_etag, new_last_modified)
     print("Snapshot updated")
 
 if __name__ == "__main__":
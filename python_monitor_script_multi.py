@@ -5,14 +5,20 @@ Checks for changes in form submission options across multiple pages and sends SM
 """
 
 import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import gzip
 import hashlib
-import requests
+import importlib.util
+import re
+import aiohttp
 from bs4 import BeautifulSoup
+import soupsieve
 import json
 from datetime import datetime
 import smtplib
+import atexit
 from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 # Twilio imports (comment out if using Gmail SMS)
 try:
@@ -21,6 +27,52 @@ try:
 except ImportError:
     TWILIO_AVAILABLE = False
 
+# Gmail SMTP connection shared by all notifications in this run
+_SMTP = None
+
+# Returned by fetch_page_content when the server answers 304 Not Modified
+NOT_MODIFIED = object()
+
+# Prefer the C-backed lxml parser, fall back to the stdlib parser if missing
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# orjson is a much faster JSON serializer, fall back to stdlib json if missing
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Only advertise brotli when we can decode it
+ACCEPT_ENCODING = 'gzip, deflate, br' if importlib.util.find_spec('brotli') else 'gzip, deflate'
+
+# Common selectors for activities and registration elements, compiled once and
+# merged so the page tree is walked once
+ACTIVITY_SELECTORS = [
+    '.activity', '.event', '.program', '.tour',
+    '[class*="activity"]', '[class*="event"]', '[class*="registration"]',
+    'button[class*="register"]', 'a[class*="register"]',
+    '.btn', 'button', 'a[href*="register"]'
+]
+ACTIVITY_SELECTOR = soupsieve.compile(', '.join(ACTIVITY_SELECTORS))
+
+# Text indicating availability, sold out, registration status
+STATUS_RE = re.compile(r'available|sold out|full|register|book now|reserve|waitlist', re.IGNORECASE)
+
+# Snapshot sections and the keys their precomputed hashes are stored under
+SECTION_HASHES = {
+    'forms': 'form_hash',
+    'activities': 'activities_hash',
+    'status_elements': 'status_hash'
+}
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Encoding': ACCEPT_ENCODING
+}
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 0.3
+
 def get_target_urls():
     """Get target URLs from environment variables or configuration"""
     # Option 1: Single URL from environment (backward compatible)
@@ -56,102 +108,127 @@ def get_snapshot_filename(page_name):
 
 def get_content_filename(page_name):
     """Generate content filename for a specific page"""
-    return f"page_content_{page_name}.html"
+    return f"page_content_{page_name}.html.gz"
 
-def fetch_page_content(url):
-    """Fetch and parse a web page"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
-    try:
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        return response.text
-    except requests.RequestException as e:
-        print(f"Error fetching page {url}: {e}")
-        return None
+def get_hash_filename(page_name):
+    """Generate raw HTML hash filename for a specific page"""
+    return f"page_hash_{page_name}.txt"
+
+async def fetch_page_content(session, url, etag=None, last_modified=None):
+    """Fetch the raw bytes and cache validators of a web page using the shared aiohttp session"""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return NOT_MODIFIED
+                response.raise_for_status()
+                content = await response.read()
+                return content, response.headers.get('ETag'), response.headers.get('Last-Modified')
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            # Retry connection-level failures with exponential backoff
+            if attempt < FETCH_RETRIES:
+                await asyncio.sleep(FETCH_BACKOFF * (2 ** attempt))
+                continue
+            print(f"Error fetching page {url}: {e}")
+            return None
+        except aiohttp.ClientError as e:
+            print(f"Error fetching page {url}: {e}")
+            return None
 
 def extract_form_data(html_content):
     """Extract relevant form data and activities from the page"""
-    soup = BeautifulSoup(html_content, 'html.parser')
+    soup = BeautifulSoup(html_content, HTML_PARSER)
     
     # Look for form elements, activity listings, and registration options
     form_data = {}
     
-    # Find forms
+    # Find forms and extract their inputs
     forms = soup.find_all('form')
     for i, form in enumerate(forms):
         form_data[f'form_{i}'] = {
             'action': form.get('action', ''),
             'method': form.get('method', ''),
-            'inputs': []
+            'inputs': [
+                {
+                    'type': inp.get('type', inp.name or 'unknown'),
+                    'name': inp.get('name', ''),
+                    'value': inp.get('value', ''),
+                    'text': inp.get_text(strip=True)
+                }
+                for inp in form.find_all(['input', 'select', 'textarea', 'button'])
+            ]
         }
-        
-        # Extract form inputs
-        inputs = form.find_all(['input', 'select', 'textarea', 'button'])
-        for inp in inputs:
-            input_data = {
-                'type': inp.get('type', inp.name if inp.name else 'unknown'),
-                'name': inp.get('name', ''),
-                'value': inp.get('value', ''),
-                'text': inp.get_text(strip=True) if inp.get_text(strip=True) else ''
-            }
-            form_data[f'form_{i}']['inputs'].append(input_data)
     
     # Look for activity listings, registration buttons, availability status
     activities = []
     
-    # Common selectors for activities and registration elements
-    activity_selectors = [
-        '.activity', '.event', '.program', '.tour',
-        '[class*="activity"]', '[class*="event"]', '[class*="registration"]',
-        'button[class*="register"]', 'a[class*="register"]',
-        '.btn', 'button', 'a[href*="register"]'
-    ]
-    
-    for selector in activity_selectors:
-        elements = soup.select(selector)
-        for elem in elements:
-            text = elem.get_text(strip=True)
-            if text and len(text) > 5:  # Filter out empty or very short text
-                activities.append({
-                    'selector': selector,
-                    'text': text,
-                    'href': elem.get('href', ''),
-                    'class': elem.get('class', [])
-                })
+    # Single pass over the tree; each element is reported once
+    for elem in ACTIVITY_SELECTOR.select(soup):
+        text = elem.get_text(strip=True)
+        if text and len(text) > 5:  # Filter out empty or very short text
+            activities.append({
+                'text': text,
+                'href': elem.get('href', ''),
+                'class': ' '.join(elem.get('class', []))
+            })
     
     # Look for any text indicating availability, sold out, registration status
-    status_keywords = ['available', 'sold out', 'full', 'register', 'book now', 'reserve', 'waitlist']
     status_elements = []
     
-    for keyword in status_keywords:
-        elements = soup.find_all(string=lambda x: x and keyword.lower() in x.lower())
-        for elem in elements:
-            if elem.parent:
-                status_elements.append({
-                    'keyword': keyword,
-                    'text': elem.strip(),
-                    'parent_tag': elem.parent.name,
-                    'parent_class': elem.parent.get('class', [])
-                })
-    
-    return {
+    for elem in soup.find_all(string=STATUS_RE):
+        parent = elem.parent
+        if parent:
+            status_elements.append({
+                'keyword': STATUS_RE.search(elem).group(0).lower(),
+                'text': elem.strip(),
+                'parent_tag': parent.name,
+                'parent_class': parent.get('class', [])
+            })
+    
+    # Plain str so the result pickles back from worker processes without the tree
+    page_title = soup.title.string if soup.title else ''
+    
+    data = {
         'forms': form_data,
         'activities': activities,
         'status_elements': status_elements,
-        'page_title': soup.title.string if soup.title else '',
+        'page_title': str(page_title) if page_title is not None else None,
         'timestamp': datetime.now().isoformat()
     }
+    for section, hash_key in SECTION_HASHES.items():
+        data[hash_key] = calculate_section_hash(data[section])
+    return data
+
+def dump_json(data, sort_keys=False, indent=False):
+    """Serialize data to JSON bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        option = 0
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, sort_keys=sort_keys, indent=2 if indent else None).encode('utf-8')
+
+def load_json(raw):
+    """Deserialize JSON bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 def load_previous_snapshot(page_name):
     """Load the previous page snapshot for a specific page"""
     snapshot_file = get_snapshot_filename(page_name)
     if os.path.exists(snapshot_file):
         try:
-            with open(snapshot_file, 'r') as f:
-                return json.load(f)
+            with open(snapshot_file, 'rb') as f:
+                return load_json(f.read())
         except (json.JSONDecodeError, IOError):
             return None
     return None
@@ -159,23 +236,87 @@ def load_previous_snapshot(page_name):
 def save_snapshot(data, page_name):
     """Save current snapshot to file for a specific page"""
     snapshot_file = get_snapshot_filename(page_name)
-    with open(snapshot_file, 'w') as f:
-        json.dump(data, f, indent=2)
+    # Write to a temp file and swap it in so an interrupted run never leaves a partial snapshot
+    tmp_file = snapshot_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(dump_json(data, indent=True))
+    os.replace(tmp_file, snapshot_file)
 
 def save_content(html_content, page_name):
     """Save raw HTML content for debugging for a specific page"""
     content_file = get_content_filename(page_name)
-    with open(content_file, 'w', encoding='utf-8') as f:
+    with gzip.open(content_file, 'wb', compresslevel=1) as f:
         f.write(html_content)
 
+def load_hash(page_name):
+    """Load the previous raw HTML hash, ETag and Last-Modified for a specific page"""
+    hash_file = get_hash_filename(page_name)
+    if os.path.exists(hash_file):
+        try:
+            with open(hash_file, 'r') as f:
+                lines = f.read().splitlines()
+            lines += [''] * (3 - len(lines))
+            return tuple(line or None for line in lines[:3])
+        except IOError:
+            pass
+    return None, None, None
+
+def save_hash(page_name, raw_hash, etag=None, last_modified=None):
+    """Save the current raw HTML hash, ETag and Last-Modified for a specific page"""
+    with open(get_hash_filename(page_name), 'w') as f:
+        f.write(f"{raw_hash}\n{etag or ''}\n{last_modified or ''}\n")
+
 def calculate_content_hash(data):
     """Calculate hash of relevant content for comparison"""
     # Remove timestamp for comparison
     comparison_data = data.copy()
     comparison_data.pop('timestamp', None)
     
-    content_str = json.dumps(comparison_data, sort_keys=True)
-    return hashlib.md5(content_str.encode()).hexdigest()
+    # Sections with a precomputed hash are represented by that hash alone
+    for section, hash_key in SECTION_HASHES.items():
+        if hash_key in comparison_data:
+            comparison_data.pop(section, None)
+    
+    return hashlib.blake2b(dump_json(comparison_data, sort_keys=True), digest_size=16).hexdigest()
+
+def calculate_section_hash(section):
+    """Calculate hash of a single snapshot section"""
+    return hashlib.blake2b(dump_json(section, sort_keys=True), digest_size=16).hexdigest()
+
+def calculate_raw_hash(html_content):
+    """Calculate hash of the raw page HTML for the quick no-change check"""
+    return hashlib.blake2b(html_content, digest_size=16).hexdigest()
+
+def _get_smtp(gmail_user, gmail_password):
+    """Get the cached Gmail SMTP connection, logging in on first use"""
+    global _SMTP
+    if _SMTP is None:
+        server = smtplib.SMTP('smtp.gmail.com', 587)
+        server.starttls()
+        server.login(gmail_user, gmail_password)
+        _SMTP = server
+    return _SMTP
+
+def _close_smtp():
+    """Close the cached SMTP connection at process exit"""
+    global _SMTP
+    if _SMTP is not None:
+        try:
+            _SMTP.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        _SMTP = None
+
+atexit.register(_close_smtp)
+
+def send_smtp_message(msg, gmail_user, gmail_password):
+    """Send a message over the cached SMTP connection, reconnecting once if it dropped"""
+    global _SMTP
+    try:
+        _get_smtp(gmail_user, gmail_password).send_message(msg)
+    except smtplib.SMTPServerDisconnected:
+        _SMTP = None
+        _get_smtp(gmail_user, gmail_password).send_message(msg)
 
 def send_sms_twilio(message):
     """Send SMS using Twilio"""
@@ -221,11 +362,7 @@ def send_sms_gmail(message):
         msg['From'] = gmail_user
         msg['To'] = sms_email
         
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        server.send_message(msg)
-        server.quit()
+        send_smtp_message(msg, gmail_user, gmail_password)
         
         print("SMS sent successfully via Gmail")
         return True
@@ -244,18 +381,12 @@ def send_email_notification(subject, body):
         return False
     
     try:
-        msg = MIMEMultipart()
+        msg = MIMEText(body)
+        msg['Subject'] = subject
         msg['From'] = gmail_user
         msg['To'] = email_recipient
-        msg['Subject'] = subject
         
-        msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        server.send_message(msg)
-        server.quit()
+        send_smtp_message(msg, gmail_user, gmail_password)
         
         print("Email sent successfully")
         return True
@@ -277,6 +408,12 @@ def compare_snapshots(old_data, new_data, page_name):
         print(f"No previous snapshot found for {page_name}, creating baseline")
         return False
     
+    # Snapshots without section hashes predate the current snapshot format,
+    # so diffing them would report format differences as page changes
+    if any(hash_key not in old_data for hash_key in SECTION_HASHES.values()):
+        print(f"Previous snapshot for {page_name} uses an older format, creating new baseline")
+        return False
+    
     old_hash = calculate_content_hash(old_data)
     new_hash = calculate_content_hash(new_data)
     
@@ -287,24 +424,15 @@ def compare_snapshots(old_data, new_data, page_name):
         changes = []
         
         # Compare forms
-        old_forms = old_data.get('forms', {})
-        new_forms = new_data.get('forms', {})
-        
-        if old_forms != new_forms:
+        if old_data['form_hash'] != new_data['form_hash']:
             changes.append(f"Form changes detected for {page_name}")
         
         # Compare activities
-        old_activities = old_data.get('activities', [])
-        new_activities = new_data.get('activities', [])
-        
-        if old_activities != new_activities:
+        if old_data['activities_hash'] != new_data['activities_hash']:
             changes.append(f"Activity changes detected for {page_name}")
         
         # Compare status elements
-        old_status = old_data.get('status_elements', [])
-        new_status = new_data.get('status_elements', [])
-        
-        if old_status != new_status:
+        if old_data['status_hash'] != new_data['status_hash']:
             changes.append(f"Status changes detected for {page_name}")
         
         if changes:
@@ -323,24 +451,43 @@ def compare_snapshots(old_data, new_data, page_name):
     
     return False
 
-def monitor_page(page_config):
+async def monitor_page(session, pool, page_config):
     """Monitor a single page"""
     page_name = page_config['name']
     url = page_config['url']
     
     print(f"Monitoring {page_name}: {url}")
     
+    # Only make the request conditional when there is a baseline to fall back on
+    previous_hash, etag, last_modified = load_hash(page_name)
+    if not os.path.exists(get_snapshot_filename(page_name)):
+        previous_hash, etag, last_modified = None, None, None
+    
     # Fetch current page content
-    html_content = fetch_page_content(url)
-    if not html_content:
+    result = await fetch_page_content(session, url, etag, last_modified)
+    if result is NOT_MODIFIED:
+        print(f"No changes detected for {page_name} (page not modified)")
+        return True
+    if not result or not result[0]:
         print(f"Failed to fetch content for {page_name}")
         return False
+    html_content, new_etag, new_last_modified = result
     
     # Save raw content for debugging
-    save_content(html_content, page_name)
+    if os.getenv('DEBUG_SAVE_HTML'):
+        save_content(html_content, page_name)
+    
+    # Skip parsing and the snapshot load entirely when the raw HTML is unchanged
+    raw_hash = calculate_raw_hash(html_content)
+    if previous_hash == raw_hash:
+        if (new_etag, new_last_modified) != (etag, last_modified):
+            save_hash(page_name, raw_hash, new_etag, new_last_modified)
+        print(f"No changes detected for {page_name} (page HTML unchanged)")
+        return True
     
-    # Extract and analyze form data
-    current_data = extract_form_data(html_content)
+    # Extract and analyze form data in a worker process so parses use multiple cores
+    loop = asyncio.get_running_loop()
+    current_data = await loop.run_in_executor(pool, extract_form_data, html_content)
     current_data['url'] = url  # Add URL to data for reference
     
     # Load previous snapshot
@@ -351,6 +498,7 @@ def monitor_page(page_config):
     
     # Save current snapshot
     save_snapshot(current_data, page_name)
+    save_hash(page_name, raw_hash, new_etag, new_last_modified)
     
     if changes_detected:
         print(f"Changes detected and notification sent for {page_name}")
@@ -359,6 +507,17 @@ def monitor_page(page_config):
     
     return True
 
+async def monitor_all(target_urls):
+    """Monitor all pages concurrently over a shared connection pool and parser process pool"""
+    connector = aiohttp.TCPConnector(limit=10)
+    timeout = aiohttp.ClientTimeout(total=30)
+    with ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as pool:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS) as session:
+            return await asyncio.gather(
+                *[monitor_page(session, pool, page_config) for page_config in target_urls],
+                return_exceptions=True
+            )
+
 def main():
     """Main function to monitor all configured pages"""
     print(f"Starting multi-page monitor at {datetime.now()}")
@@ -379,14 +538,14 @@ def main():
         send_notification("🧪 This is a test notification from the multi-page monitor")
         return
     
-    # Monitor each page
+    # Monitor all pages concurrently
+    results = asyncio.run(monitor_all(target_urls))
     success_count = 0
-    for page_config in target_urls:
-        try:
-            if monitor_page(page_config):
-                success_count += 1
-        except Exception as e:
-            print(f"Error monitoring {page_config['name']}: {e}")
+    for page_config, result in zip(target_urls, results):
+        if isinstance(result, Exception):
+            print(f"Error monitoring {page_config['name']}: {result}")
+        elif result:
+            success_count += 1
     
     print(f"Monitoring complete. Successfully monitored {success_count}/{len(target_urls)} pages")
 